@@ -0,0 +1,48 @@
+import threading
+from collections import OrderedDict
+
+
+class ContentCache:
+    """
+    Bodies of frequently requested files kept in memory, least recently used first out.
+    Entries are tied to the file's mtime and size, so a changed file is never served stale.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entry_bytes: int = 8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.size = 0
+        self.entries = OrderedDict()  # filepath -> (mtime_ns, size, body)
+        self.lock = threading.Lock()
+
+    def get(self, filepath: str, mtime_ns: int, size: int):
+        with self.lock:
+            entry = self.entries.get(filepath)
+            if entry is None:
+                return None
+            if entry[:2] != (mtime_ns, size):
+                self._remove(filepath)
+                return None
+            self.entries.move_to_end(filepath)
+            return entry[2]
+
+    def put(self, filepath: str, mtime_ns: int, size: int, body: bytes):
+        if len(body) > self.max_entry_bytes:
+            return
+
+        with self.lock:
+            self._remove(filepath)
+            self.entries[filepath] = (mtime_ns, size, body)
+            self.size += len(body)
+
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+
+    def invalidate(self, filepath: str):
+        with self.lock:
+            self._remove(filepath)
+
+    def _remove(self, filepath: str):
+        entry = self.entries.pop(filepath, None)
+        if entry is not None:
+            self.size -= len(entry[2])
@@ -3,8 +3,11 @@ import time
 
 
 class IpRequestFilter:
-    def __init__(self, requests_per_second: int):
+    def __init__(self, requests_per_second: int, max_tracked_ips: int = 100_000):
         self.requests_per_second = requests_per_second
+        # counts are exact, but memory is bounded: once max_tracked_ips different clients have been
+        # seen in the current second, requests from further clients are refused until the next one
+        self.max_tracked_ips = max_tracked_ips
         self.current_second = int(time.time().__floor__())
         self.current_second_map = {}
         self.request_update_lock = threading.Lock()
@@ -20,7 +23,8 @@ class IpRequestFilter:
                 self.current_second_map = {}
 
             count = self.current_second_map.get(address, 0) + 1
+            if count == 1 and len(self.current_second_map) >= self.max_tracked_ips:
+                return False
             self.current_second_map[address] = count
 
             return count <= self.requests_per_second
-
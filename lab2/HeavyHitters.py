@@ -0,0 +1,127 @@
+import hashlib
+import threading
+from array import array
+
+
+class CountMinSketch:
+    """
+    Approximate counts for any number of keys in width * depth * 8 bytes.
+    Estimates never undercount; with conservative updates they overcount by at most
+    e / width of the total with probability 1 - e ** -depth.
+
+    Supports the same get/set pattern as a dict of counters, so it can replace one:
+    setting a key to a value only raises the cells that are below it.
+    """
+
+    def __init__(self, width: int = 2048, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.tables = [array("Q", bytes(8 * width)) for _ in range(depth)]
+
+    def _indexes(self, key: str):
+        # two independent hashes combined give one index per row (Kirsch-Mitzenmacher)
+        digest = hashlib.blake2b(key.encode(errors="replace"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def add(self, key: str, count: int = 1) -> int:
+        """Adds count to key and returns its new estimate."""
+        indexes = self._indexes(key)
+        value = min(table[i] for table, i in zip(self.tables, indexes)) + count
+        for table, i in zip(self.tables, indexes):
+            if table[i] < value:
+                table[i] = value
+        return value
+
+    def __getitem__(self, key: str) -> int:
+        return min(table[i] for table, i in zip(self.tables, self._indexes(key)))
+
+    def __setitem__(self, key: str, value: int):
+        for table, i in zip(self.tables, self._indexes(key)):
+            if table[i] < value:
+                table[i] = value
+
+    def get(self, key: str, default: int = 0) -> int:
+        return self[key] or default
+
+    def merge(self, other: "CountMinSketch"):
+        """Adds the counts of another sketch of the same size (e.g. from another process)."""
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("can only merge sketches of the same size")
+        for table, other_table in zip(self.tables, other.tables):
+            for i, value in enumerate(other_table):
+                table[i] += value
+
+    def to_dict(self) -> dict:
+        return {"width": self.width, "depth": self.depth, "tables": [table.tolist() for table in self.tables]}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CountMinSketch":
+        sketch = cls(data["width"], data["depth"])
+        sketch.tables = [array("Q", table) for table in data["tables"]]
+        return sketch
+
+
+class SpaceSaving:
+    """
+    The k most frequent keys of a stream (space-saving algorithm) in O(k) memory.
+    A key that is not tracked replaces the smallest counter and inherits its count,
+    which is remembered as the key's possible overestimation.
+    """
+
+    def __init__(self, k: int = 32):
+        self.k = k
+        self.counters = {}  # key -> [count, error]
+
+    def add(self, key: str, count: int = 1):
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] += count
+        elif len(self.counters) < self.k:
+            self.counters[key] = [count, 0]
+        else:
+            victim = min(self.counters, key=lambda k: self.counters[k][0])
+            smallest = self.counters.pop(victim)[0]
+            self.counters[key] = [smallest + count, smallest]
+
+    def top(self, n: int = None) -> list:
+        """[(key, count, error), ...] from the most frequent, the true count is in [count - error, count]."""
+        ranked = sorted(((key, c[0], c[1]) for key, c in self.counters.items()), key=lambda item: -item[1])
+        return ranked[:n] if n is not None else ranked
+
+    def guaranteed_count(self, key: str) -> int:
+        counter = self.counters.get(key)
+        return counter[0] - counter[1] if counter else 0
+
+
+class TrafficStats:
+    """Hottest paths and noisiest client IPs in a fixed amount of memory, whatever the number of distinct keys."""
+
+    def __init__(self, top_k: int = 64):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.top_paths = SpaceSaving(top_k)
+        self.top_ips = SpaceSaving(top_k)
+
+    def record_request(self, ip: str):
+        with self.lock:
+            self.requests += 1
+            self.top_ips.add(ip)
+
+    def record_hit(self, path: str):
+        with self.lock:
+            self.top_paths.add(path)
+
+    def hot_paths(self, n: int = None) -> list:
+        with self.lock:
+            return self.top_paths.top(n)
+
+    def noisy_ips(self, n: int = None) -> list:
+        with self.lock:
+            return self.top_ips.top(n)
+
+    def is_hot(self, path: str, min_hits: int = 2) -> bool:
+        """Whether path is among the top paths with at least min_hits hits for sure."""
+        with self.lock:
+            return self.top_paths.guaranteed_count(path) >= min_hits
@@ -2,10 +2,14 @@ import threading
 import time
 from collections import defaultdict
 
+from HeavyHitters import CountMinSketch
+
+
 class HitCounter:
-    def __init__(self, with_lock=False, sleeping: float = 0):
+    def __init__(self, with_lock=False, sleeping: float = 0, approximate=False):
         self.sleeping = sleeping
-        self.file_counter_map = defaultdict(int)
+        # a count-min sketch takes the same memory however many files get hit, counts may be slightly high
+        self.file_counter_map = CountMinSketch() if approximate else defaultdict(int)
         self.with_lock = with_lock
         self.lock = threading.Lock()
 
@@ -23,3 +27,18 @@ class HitCounter:
 
     def hit_count(self, filename: str):
         return self.file_counter_map[filename]
+
+    def export_state(self) -> dict:
+        with self.lock:
+            if isinstance(self.file_counter_map, CountMinSketch):
+                return {"sketch": self.file_counter_map.to_dict()}
+            return {"counts": dict(self.file_counter_map)}
+
+    def merge_state(self, state: dict):
+        """Adds counts exported by another HitCounter, e.g. the process this one replaced."""
+        with self.lock:
+            if "sketch" in state:
+                self.file_counter_map.merge(CountMinSketch.from_dict(state["sketch"]))
+            else:
+                for filename, count in state["counts"].items():
+                    self.file_counter_map[filename] += count
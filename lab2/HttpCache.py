@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+
+class HttpCache:
+    """
+    On-disk cache for HttpClient GET responses.
+
+    Bodies are stored once per content under objects/<sha256>, index.json maps every URL to its body,
+    validators (ETag, Last-Modified) and expiry time. Fresh entries are served without the network,
+    stale ones are revalidated with a conditional request. The total size of the stored bodies is
+    kept under max_bytes by evicting the least recently used entries. Hits only update recency in
+    memory, it is written to the index with the next store or by save().
+    """
+
+    revalidation_headers = ("cache-control", "expires", "etag", "last-modified", "date")
+
+    def __init__(self, directory: str, max_bytes: int = 100 * 1024 * 1024):
+        self.directory = directory
+        self.objects_directory = os.path.join(directory, "objects")
+        self.index_path = os.path.join(directory, "index.json")
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+        os.makedirs(self.objects_directory, exist_ok=True)
+
+        self.entries = {}
+        self.recency_changed = False
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path) as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                print("Cache index is unreadable, starting empty")
+
+    def lookup(self, key: str):
+        """The entry for key with its body, or None. Marks it as recently used."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            body = self._read_object(entry["body"])
+            if body is None:
+                # body removed behind our back
+                del self.entries[key]
+                self._save_index()
+                return None
+
+            entry["last_used"] = time.time()
+            self.recency_changed = True
+            return dict(entry), body
+
+    @staticmethod
+    def is_fresh(entry: dict) -> bool:
+        return time.time() < entry["expires"]
+
+    @staticmethod
+    def conditional_headers(entry: dict) -> dict:
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, key: str, headers: dict, body: bytes):
+        """Stores a 200 response unless Cache-Control forbids it or it could never be reused."""
+        expires = self._expires(headers)
+        if expires is None or len(body) > self.max_bytes:
+            return
+
+        if expires <= time.time() and not (headers.get("etag") or headers.get("last-modified")):
+            # stale right away and nothing to revalidate with
+            return
+
+        digest = hashlib.sha256(body).hexdigest()
+        object_path = os.path.join(self.objects_directory, digest)
+
+        with self.lock:
+            if not os.path.exists(object_path):
+                temp_path = f"{object_path}.{threading.get_ident()}.tmp"
+                with open(temp_path, "wb") as f:
+                    f.write(body)
+                os.replace(temp_path, object_path)
+
+            previous = self.entries.get(key)
+            self.entries[key] = {
+                "body": digest,
+                "size": len(body),
+                "headers": headers,
+                "etag": headers.get("etag"),
+                "last_modified": headers.get("last-modified"),
+                "expires": expires,
+                "last_used": time.time(),
+            }
+            if previous is not None:
+                self._remove_object_if_unused(previous["body"])
+
+            self._evict()
+            self._save_index()
+
+    def refresh(self, key: str, headers: dict):
+        """Applies the headers of a 304 Not Modified to the stored entry, returns the updated entry."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            expires = self._expires(headers)
+            entry["expires"] = expires if expires is not None else time.time()
+            # only freshness and validators, the rest of a 304 may describe an empty body
+            entry["headers"].update({k: v for k, v in headers.items() if k in self.revalidation_headers})
+            entry["etag"] = headers.get("etag", entry["etag"])
+            entry["last_modified"] = headers.get("last-modified", entry["last_modified"])
+            entry["last_used"] = time.time()
+            self._save_index()
+            return dict(entry)
+
+    def save(self):
+        """Writes recency changes from hits to the index, e.g. before exiting."""
+        with self.lock:
+            if self.recency_changed:
+                self._save_index()
+
+    def record(self, outcome: str):
+        """Counts a request answered as "hits", "revalidated" or "misses"."""
+        with self.lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def stats(self) -> str:
+        with self.lock:
+            stored = sum(self._object_sizes().values())
+            total = self.hits + self.revalidated + self.misses
+            hit_ratio = (self.hits + self.revalidated) / total if total else 0
+            return (f"Cache: {self.hits} hits, {self.revalidated} revalidated, {self.misses} misses "
+                    f"({hit_ratio:.0%} served from cache), {len(self.entries)} entries, "
+                    f"{stored}/{self.max_bytes} bytes")
+
+    @staticmethod
+    def _expires(headers: dict):
+        """Expiry timestamp from Cache-Control/Expires, None if the response must not be stored."""
+        directives = {}
+        for directive in headers.get("cache-control", "").lower().split(","):
+            name, _, value = directive.strip().partition("=")
+            if name:
+                directives[name] = value.strip('"')
+
+        if "no-store" in directives:
+            return None
+
+        now = time.time()
+        if "no-cache" in directives:
+            return now
+
+        if directives.get("max-age", "").isdigit():
+            return now + int(directives["max-age"])
+
+        if "expires" in headers:
+            try:
+                return parsedate_to_datetime(headers["expires"]).timestamp()
+            except (TypeError, ValueError):
+                # invalid dates such as "0" mean already expired
+                return now
+
+        return now
+
+    def _read_object(self, digest: str):
+        try:
+            with open(os.path.join(self.objects_directory, digest), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _object_sizes(self) -> dict:
+        return {entry["body"]: entry["size"] for entry in self.entries.values()}
+
+    def _remove_object_if_unused(self, digest: str):
+        if any(entry["body"] == digest for entry in self.entries.values()):
+            return
+        try:
+            os.remove(os.path.join(self.objects_directory, digest))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while sum(self._object_sizes().values()) > self.max_bytes:
+            key = min(self.entries, key=lambda k: self.entries[k]["last_used"])
+            entry = self.entries.pop(key)
+            self._remove_object_if_unused(entry["body"])
+
+    def _save_index(self):
+        temp_path = f"{self.index_path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(temp_path, self.index_path)
+        self.recency_changed = False
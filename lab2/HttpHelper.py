@@ -1,18 +1,37 @@
 from socket import socket
 
 
+status_messages = {
+    200: "OK",
+    201: "Created",
+    206: "Partial Content",
+    304: "Not Modified",
+    400: "Bad Request",
+    401: "Unauthorized",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    411: "Length Required",
+    413: "Payload Too Large",
+    416: "Range Not Satisfiable",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    501: "Not Implemented",
+    502: "Bad Gateway",
+    503: "Service Unavailable",
+    507: "Insufficient Storage",
+}
+
+
 def build_http_response(status_code: int, body: bytes, headers: dict = None) -> bytes:
 
-    status_messages = {
-        200: "OK",
-        404: "Not Found",
-        405: "Method Not Allowed",
-    }
     status_message = status_messages.get(status_code, "OK")
 
     final_headers = {
         "Content-Length": str(len(body)),
         "Content-Type": "text/html",
+        "Connection": "close",
     }
 
     if headers:
@@ -27,6 +46,8 @@ def build_http_request(method: str, path: str, host: str, headers: dict = None,
     final_headers = {"Host": host, "Content-Length": str(len(body)), "Connection": "close"}
     if headers:
         final_headers.update(headers)
+        if "chunked" in final_headers.get("Transfer-Encoding", "").lower():
+            del final_headers["Content-Length"]
 
     headers_text = "".join(f"{k}: {v}\r\n" for k, v in final_headers.items())
     request_line = f"{method} {path} HTTP/1.1\r\n"
@@ -48,9 +69,12 @@ def get_content_type(file_path: str) -> str:
 
 import socket
 
-def _receive_http_common(con: socket.socket):
-    """Reads raw HTTP headers and body from socket, returns (first_line, headers, body)."""
-    data = b""
+def receive_http_head(con: socket.socket, initial: bytes = b""):
+    """
+    Reads raw HTTP headers from socket, returns (first_line, headers, rest) where rest is the body received so far.
+    initial holds bytes already read from the socket, e.g. what followed a previous head.
+    """
+    data = initial
     while b"\r\n\r\n" not in data:
         chunk = con.recv(4096)
         if not chunk:
@@ -70,6 +94,113 @@ def _receive_http_common(con: socket.socket):
             k, v = line.split(": ", 1)
             headers[k.strip().lower()] = v.strip()
 
+    return first_line, headers, rest
+
+
+class SocketReader:
+    """Buffered reads from a socket, starting with the bytes that arrived together with the headers."""
+
+    def __init__(self, con: socket.socket, initial: bytes = b"", recv_size: int = 65536):
+        self.con = con
+        self.buffer = initial
+        self.recv_size = recv_size
+
+    def _fill(self) -> bool:
+        chunk = self.con.recv(self.recv_size)
+        if not chunk:
+            return False
+        self.buffer += chunk
+        return True
+
+    def read_some(self, max_size: int) -> bytes:
+        """Up to max_size bytes, b"" once the peer has closed."""
+        if not self.buffer and not self._fill():
+            return b""
+        data, self.buffer = self.buffer[:max_size], self.buffer[max_size:]
+        return data
+
+    def read_line(self) -> bytes:
+        while b"\r\n" not in self.buffer:
+            if not self._fill():
+                raise ConnectionError("connection closed in the middle of a line")
+        line, self.buffer = self.buffer.split(b"\r\n", 1)
+        return line
+
+
+def iter_http_body(con: socket.socket, headers: dict, rest: bytes = b"", chunk_size: int = 65536, until_close: bool = False):
+    """
+    Yields the body in pieces of at most chunk_size bytes, so it never has to be held in memory at once.
+    Handles Content-Length and chunked transfer encoding; without either the body is empty,
+    unless until_close is set (responses delimited by the server closing the connection).
+    """
+    reader = SocketReader(con, rest, recv_size=chunk_size)
+
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        while True:
+            size_line = reader.read_line()
+            size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+            if size == 0:
+                # skip trailers up to the empty line
+                while reader.read_line():
+                    pass
+                return
+            remaining = size
+            while remaining > 0:
+                data = reader.read_some(min(chunk_size, remaining))
+                if not data:
+                    raise ConnectionError("connection closed in the middle of a chunk")
+                remaining -= len(data)
+                yield data
+            reader.read_line()
+    elif "content-length" in headers:
+        remaining = int(headers["content-length"])
+        while remaining > 0:
+            data = reader.read_some(min(chunk_size, remaining))
+            if not data:
+                raise ConnectionError(f"connection closed with {remaining} body bytes missing")
+            remaining -= len(data)
+            yield data
+    elif until_close:
+        while True:
+            data = reader.read_some(chunk_size)
+            if not data:
+                return
+            yield data
+
+
+class ClientBody:
+    """
+    A request body streamed from the client, remembers whether reading it failed, so that errors of
+    the client's connection can be told apart from those of whatever the body is written to.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.failed = False
+
+    def __iter__(self):
+        try:
+            yield from self.chunks
+        except (OSError, ValueError):
+            self.failed = True
+            raise
+
+
+def iter_chunked_encoding(chunks):
+    """Frames an iterable of byte strings with chunked transfer encoding."""
+    for data in chunks:
+        if data:
+            yield f"{len(data):x}\r\n".encode() + data + b"\r\n"
+    yield b"0\r\n\r\n"
+
+
+def _receive_http_common(con: socket.socket):
+    """Reads raw HTTP headers and body from socket, returns (first_line, headers, body)."""
+    head = receive_http_head(con)
+    if head is None:
+        return None
+    first_line, headers, rest = head
+
     # Read body
     body = rest
     content_length = int(headers.get("content-length", "0"))
@@ -101,6 +232,24 @@ def receive_http_request(s: socket.socket):
     return method, path, version, headers, body
 
 
+def receive_http_request_head(s: socket.socket):
+    """
+    Like receive_http_request but leaves the body on the socket, to be read with iter_http_body.
+    :return: method, path, version, headers, rest (body bytes received together with the headers)
+    """
+    result = receive_http_head(s)
+    if result is None:
+        return None
+    first_line, headers, rest = result
+
+    parts = first_line.split(" ", 2)
+    if len(parts) != 3:
+        return None
+    method, path, version = parts
+
+    return method, path, version, headers, rest
+
+
 def receive_http_response(s: socket.socket):
     """
     :param s:
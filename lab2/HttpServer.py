@@ -1,17 +1,32 @@
 import base64
+import errno
+import hashlib
+import hmac
+import json
 import random
+import signal
 import socket
 import os
+import stat
+import subprocess
 import sys
+import tempfile
+import threading
 import time
 from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+from html import escape
 from mimetypes import guess_type
 from threading import Thread
 from urllib.parse import unquote
 
+from ContentCache import ContentCache
 from FileHelper import file_has_one_of_extensions
 from Filter import IpRequestFilter
+from HeavyHitters import TrafficStats
 from HitCounter import HitCounter
+from Shaper import EgressShaper
+from TrafficRecorder import TrafficRecorder
 from HttpHelper import *
 
 
@@ -21,43 +36,92 @@ class HtmlServer:
     page_method_not_allowed = build_http_response(405, b"<h1>405 Method Not Allowed<h1>")
     page_too_many_requests = build_http_response(429, b"<h1>429 Too Many Requests<h1>", headers={"Connection": "close"})
 
-    def __init__(self, host="0.0.0.0", port=8080, served_directory=None, allowed_extensions=(".html", ".htm", ".pdf", ".png")):
+    upload_chunk_size = 64 * 1024
+    stats_path = "/_admin/stats"
+
+    # environment variables used to pass sockets to the process started on reload
+    listen_fd_env = "HTTP_SERVER_LISTEN_FD"
+    handoff_fd_env = "HTTP_SERVER_HANDOFF_FD"
+
+    def __init__(self, host="0.0.0.0", port=8080, served_directory=None, allowed_extensions=(".html", ".htm", ".pdf", ".png"), requests_per_second=5,
+                 upload_credentials=None, max_upload_size=4 * 1024 ** 3, drain_timeout=60,
+                 record_path=None, shaper=None, admin_credentials=None):
         self.host = host
         self.port = port
         self.allowed_extensions = allowed_extensions
+        # "user:password" allowed to PUT/POST files, uploads are disabled when None
+        self.upload_credentials = upload_credentials
+        self.max_upload_size = max_upload_size
+        # "user:password" allowed to see the stats page, which does not exist when None
+        self.admin_credentials = admin_credentials
+        # uploaded files get the permissions any other new file would get, os.umask can only be read by setting it
+        self.umask = os.umask(0)
+        os.umask(self.umask)
         self.served_directory = os.path.abspath(served_directory or os.getcwd())
-        self.filter = IpRequestFilter(5)
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.hit_counter = HitCounter(with_lock=True, sleeping=0)
+        self.filter = IpRequestFilter(requests_per_second)
+        self.hit_counter = HitCounter(with_lock=True, sleeping=0, approximate=True)
+        self.traffic = TrafficStats()
+        self.content_cache = ContentCache()
+        self.recorder = TrafficRecorder(record_path) if record_path else None
+        # byte-rate limits for response bodies, unlimited by default
+        self.shaper = shaper or EgressShaper()
+
+        # started by a reload: the listening socket is already bound and listening
+        self.inherited = self.listen_fd_env in os.environ
+        if self.inherited:
+            self.sock = socket.socket(fileno=int(os.environ.pop(self.listen_fd_env)))
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+        self.accepting = True
+        self.drain_timeout = drain_timeout
+        self.in_flight = 0
+        self.in_flight_condition = threading.Condition()
+        self.handoff = None
 
         print("Serving directory:", self.served_directory)
 
     def handle_request(self, conn, addr):
 
-        if not self.filter.process(addr[0]):
-            conn.sendall(self.page_too_many_requests)
-            conn.shutdown(socket.SHUT_WR)
-            time.sleep(0.01)
+        arrived = time.time()
+        self.traffic.record_request(addr[0])
 
-            conn.close()
+        if not self.filter.process(addr[0]):
+            if self.recorder is not None:
+                # rejected requests are part of the traffic too, read what the client sent
+                conn.settimeout(1)
+                try:
+                    self.record(arrived, addr, receive_http_request_head(conn))
+                except OSError:
+                    pass
+            self.send_too_many_requests(conn)
             return
 
         time.sleep(0.5 + random.random())
 
-        result = receive_from_http_socket(conn, type="request")
+        result = receive_http_request_head(conn)
+        self.record(arrived, addr, result)
 
         if not result:
             conn.close()
             return
 
-        method, path, version, headers, body = result
+        method, path, version, headers, rest = result
+
+        if method in ("PUT", "POST") and self.upload_credentials is not None:
+            self.handle_upload(conn, method, path, headers, rest)
+            return
 
         if method != "GET":
             conn.sendall(self.page_method_not_allowed)
             conn.close()
             return
 
+        if path.split("?", 1)[0] == self.stats_path:
+            self.send_stats(conn, headers)
+            return
+
         # Normalize path
         rel_path = unquote(path.lstrip("/"))
         filepath = os.path.abspath(os.path.join(self.served_directory, rel_path))
@@ -73,9 +137,10 @@ class HtmlServer:
         if os.path.isdir(filepath):
 
             self.hit_counter.hit(filepath)
+            self.traffic.record_hit("/" + rel_path)
             body = self.generate_file_listing_html(rel_path).encode()
             page = build_http_response(200, body)
-            conn.sendall(page)
+            self.shaper.sendall(conn, addr[0], page, content_type="text/html")
             conn.close()
             return
 
@@ -84,16 +149,281 @@ class HtmlServer:
             conn.close()
             return
 
+        # validators let clients revalidate cached copies instead of downloading again
+        stat = os.stat(filepath)
+        validators = {
+            "ETag": f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+            "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        }
+
+        byte_range = self.requested_range(headers, stat.st_size, validators)
+
+        # a segmented download asks for many ranges, only its first one counts as a hit
+        if byte_range is None or byte_range[0] == 0:
+            self.hit_counter.hit(filepath)
+            self.traffic.record_hit("/" + rel_path)
+
+        if self.not_modified(headers, validators["ETag"], stat.st_mtime):
+            conn.sendall(build_http_response(304, b"", headers=validators))
+            conn.close()
+            return
+
+        if byte_range == (None, None):
+            conn.sendall(build_http_response(416, b"<h1>416 Range Not Satisfiable</h1>",
+                                             headers={"Content-Range": f"bytes */{stat.st_size}"}))
+            conn.close()
+            return
+
         # serve file
+        headers = {"Content-Type": get_content_type(filepath), "Accept-Ranges": "bytes", **validators}
+        self.send_file(conn, addr[0], filepath, stat, headers, hot="/" + rel_path, byte_range=byte_range)
+        conn.close()
+
+    @staticmethod
+    def requested_range(headers, size, validators):
+        """
+        (start, end) of a single-range 'Range: bytes=...' request, None to send the whole file
+        and (None, None) if the range lies outside the file.
+        """
+        value = headers.get("range", "")
+        if not value.startswith("bytes=") or "," in value:
+            return None
+
+        # If-Range: the range only applies to the version of the file the client already has
+        if headers.get("if-range", validators["ETag"]) not in (validators["ETag"], validators["Last-Modified"]):
+            return None
+
+        first, _, last = value[len("bytes="):].strip().partition("-")
+        try:
+            if first == "":
+                # "bytes=-500" is the last 500 bytes
+                start, end = max(0, size - int(last)), size - 1
+                if int(last) == 0:
+                    return None, None
+            else:
+                start = int(first)
+                end = min(int(last), size - 1) if last else size - 1
+        except ValueError:
+            return None
+
+        if start > end or start >= size:
+            return None, None
+        return start, end
+
+    def send_file(self, conn, ip, filepath, stat, headers, hot=None, byte_range=None):
+        """
+        Sends the file (206 with byte_range), from memory when it is cached, otherwise streamed from disk.
+        """
+        status, start, length = 200, 0, stat.st_size
+        if byte_range is not None:
+            status, start, length = 206, byte_range[0], byte_range[1] - byte_range[0] + 1
+            headers = {**headers, "Content-Range": f"bytes {byte_range[0]}-{byte_range[1]}/{stat.st_size}"}
+
+        body = self.content_cache.get(filepath, stat.st_mtime_ns, stat.st_size)
+
+        # only files among the hottest paths are worth keeping in memory
+        if body is None and hot is not None and stat.st_size <= self.content_cache.max_entry_bytes \
+                and self.traffic.is_hot(hot):
+            with open(filepath, "rb") as f:
+                body = f.read()
+            if len(body) == stat.st_size:
+                self.content_cache.put(filepath, stat.st_mtime_ns, stat.st_size, body)
+
+        content_type = headers.get("Content-Type")
+        if body is not None:
+            page = build_http_response(status, body[start:start + length], headers=headers)
+            self.shaper.sendall(conn, ip, page, content_type)
+            return
+
         with open(filepath, "rb") as f:
+            conn.sendall(build_http_response(status, b"", headers={**headers, "Content-Length": str(length)}))
+            self.shaper.sendfile(conn, ip, f, length, content_type, offset=start)
 
-            self.hit_counter.hit(filepath)
+    @staticmethod
+    def not_modified(headers, etag, mtime):
+        if "if-none-match" in headers:
+            return etag in (tag.strip() for tag in headers["if-none-match"].split(","))
 
-            body = f.read()
-            content_type = get_content_type(filepath)
-            response = build_http_response(200, body, headers={"Content-Type": content_type})
-            conn.sendall(response)
+        if "if-modified-since" in headers:
+            try:
+                return int(mtime) <= parsedate_to_datetime(headers["if-modified-since"]).timestamp()
+            except (TypeError, ValueError):
+                return False
+
+        return False
+
+    def handle_upload(self, conn, method, path, headers, rest):
+        try:
+            status, extra_headers = self.receive_upload(conn, method, path, headers, rest)
+        except ValueError as e:
+            # broken chunked encoding
+            print("Upload failed:", e)
+            conn.sendall(build_http_response(400, b"<h1>400 Bad Request</h1>"))
             conn.close()
+            return
+        except OSError as e:
+            # client went away
+            print("Upload failed:", e)
+            conn.close()
+            return
+
+        body = f"<h1>{status} {status_messages.get(status, 'OK')}</h1>".encode()
+        conn.sendall(build_http_response(status, body, headers=extra_headers))
+        conn.close()
+
+    def receive_upload(self, conn, method, path, headers, rest):
+        """
+        Streams a PUT/POST body into the target file, returns (status, headers) of the response.
+        PUT creates or replaces the file, POST only creates it.
+        """
+        if not self.authorized(headers, self.upload_credentials):
+            return 401, {"WWW-Authenticate": 'Basic realm="uploads"'}
+
+        rel_path = unquote(path.split("?", 1)[0].lstrip("/"))
+        filepath = os.path.abspath(os.path.join(self.served_directory, rel_path))
+
+        if os.path.commonpath([self.served_directory, filepath]) != self.served_directory or filepath == self.served_directory:
+            return 403, {}
+        if not file_has_one_of_extensions(filepath, allowed_extensions=self.allowed_extensions):
+            return 403, {}
+        if os.path.isdir(filepath):
+            return 409, {}
+
+        existed = os.path.exists(filepath)
+        if method == "POST" and existed:
+            return 409, {}
+
+        chunked = "chunked" in headers.get("transfer-encoding", "").lower()
+        if not chunked and "content-length" not in headers:
+            return 411, {}
+        if not chunked and not (headers["content-length"].isascii() and headers["content-length"].isdigit()):
+            return 400, {}
+        if not chunked and int(headers["content-length"]) > self.max_upload_size:
+            return 413, {}
+
+        expected_digest = self.expected_sha256(headers)
+
+        if headers.get("expect", "").lower() == "100-continue":
+            conn.sendall(b"HTTP/1.1 100 Continue\r\n\r\n")
+
+        directory = os.path.dirname(filepath)
+        body = ClientBody(iter_http_body(conn, headers, rest, chunk_size=self.upload_chunk_size))
+        temp_path = None
+        try:
+            os.makedirs(directory, exist_ok=True)
+
+            # written next to the target so the final rename stays on the same filesystem
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".upload-", suffix=".tmp")
+            digest = hashlib.sha256()
+            received = 0
+            with os.fdopen(fd, "wb") as f:
+                for chunk in body:
+                    received += len(chunk)
+                    if received > self.max_upload_size:
+                        return 413, {}
+                    digest.update(chunk)
+                    f.write(chunk)
+
+            if expected_digest is not None and not hmac.compare_digest(digest.digest(), expected_digest):
+                return 400, {}
+
+            # mkstemp creates the file readable by its owner only, keep the mode of the file being
+            # replaced or give it the default one
+            try:
+                mode = stat.S_IMODE(os.stat(filepath).st_mode)
+            except FileNotFoundError:
+                mode = 0o666 & ~self.umask
+            os.chmod(temp_path, mode)
+
+            os.replace(temp_path, filepath)
+            self.content_cache.invalidate(filepath)
+        except OSError as e:
+            if body.failed:
+                # the client went away
+                raise
+            print(f"Could not store upload to {filepath}:", e)
+            return self.storage_error_status(e), {}
+        finally:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        print(f"Uploaded {received} bytes to {filepath}")
+        return (200 if existed else 201), {"Location": "/" + rel_path.replace(os.sep, "/")}
+
+    @staticmethod
+    def storage_error_status(error: OSError) -> int:
+        if isinstance(error, (FileExistsError, NotADirectoryError, IsADirectoryError)):
+            # a file where a directory is needed, or the other way round
+            return 409
+        if error.errno in (errno.ENOSPC, errno.EDQUOT):
+            return 507
+        return 500
+
+    def authorized(self, headers, allowed):
+        """Whether the request carries HTTP Basic credentials equal to allowed ("user:password")."""
+        scheme, _, credentials = headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "basic":
+            return False
+        try:
+            decoded = base64.b64decode(credentials, validate=True)
+        except ValueError:
+            return False
+        return hmac.compare_digest(decoded, allowed.encode())
+
+    @staticmethod
+    def expected_sha256(headers):
+        """The checksum from a 'Digest: sha-256=<base64>' header, None if the client sent none."""
+        for digest in headers.get("digest", "").split(","):
+            algorithm, _, value = digest.strip().partition("=")
+            if algorithm.lower() == "sha-256":
+                try:
+                    return base64.b64decode(value)
+                except ValueError:
+                    return b""
+        return None
+
+    def record(self, arrived, addr, request_head):
+        if self.recorder is not None and request_head:
+            method, path, version, headers, rest = request_head
+            self.recorder.record(arrived, addr[0], method, path, headers)
+
+    def send_stats(self, conn, headers):
+        if self.admin_credentials is None:
+            conn.sendall(self.page404)
+        elif not self.authorized(headers, self.admin_credentials):
+            body = b"<h1>401 Unauthorized</h1>"
+            conn.sendall(build_http_response(401, body, headers={"WWW-Authenticate": 'Basic realm="admin"'}))
+        else:
+            conn.sendall(build_http_response(200, self.generate_stats_html().encode()))
+        conn.close()
+
+    def generate_stats_html(self):
+        html = "<html><body>"
+        html += f"<h2>Traffic: {self.traffic.requests} requests</h2>"
+
+        html += "<h3>Hottest paths</h3><ol>"
+        for path, count, error in self.traffic.hot_paths(20):
+            filepath = os.path.abspath(os.path.join(self.served_directory, path.lstrip("/")))
+            cached = " (cached)" if filepath in self.content_cache.entries else ""
+            html += f'<li><a href="{escape(path)}">{escape(path)}</a>: {count - error}..{count} hits{cached}</li>'
+        html += "</ol>"
+
+        html += "<h3>Noisiest clients</h3><ol>"
+        for ip, count, error in self.traffic.noisy_ips(20):
+            html += f"<li>{escape(ip)}: {count - error}..{count} requests</li>"
+        html += "</ol>"
+
+        html += (f"<p>Content cache: {len(self.content_cache.entries)} files, "
+                 f"{self.content_cache.size}/{self.content_cache.max_bytes} bytes</p>")
+        html += "</body></html>"
+        return html
+
+    def send_too_many_requests(self, conn):
+        conn.sendall(self.page_too_many_requests)
+        conn.shutdown(socket.SHUT_WR)
+        time.sleep(0.01)
+
+        conn.close()
 
     def generate_file_listing_html(self, rel_path=""):
 
@@ -135,12 +465,107 @@ class HtmlServer:
                 time.sleep(10)
 
     def serve_forever(self):
-        self.bind_socket()
-        self.sock.listen(100)
+        if self.inherited:
+            print("Using listening socket from the previous process")
+        else:
+            self.bind_socket()
+            self.sock.listen(100)
         print(f"Server running on http://{self.host}:{self.port}")
 
+        # the timeout only makes accept() look at self.accepting twice a second
+        self.sock.settimeout(0.5)
+
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, lambda signum, frame: Thread(target=self.reload, daemon=True).start())
+        if self.handoff_fd_env in os.environ:
+            self.finish_takeover(int(os.environ.pop(self.handoff_fd_env)))
+
         with ThreadPoolExecutor(max_workers=1000) as executor:
-            while True:
-                conn, addr = self.sock.accept()
+            while self.accepting:
+                try:
+                    conn, addr = self.sock.accept()
+                except TimeoutError:
+                    continue
                 print("Connected by", addr)
-                executor.submit(self.handle_request, conn, addr)
+                with self.in_flight_condition:
+                    self.in_flight += 1
+                executor.submit(self.handle_tracked, conn, addr)
+
+            self.drain()
+
+    def handle_tracked(self, conn, addr):
+        try:
+            self.handle_request(conn, addr)
+        finally:
+            with self.in_flight_condition:
+                self.in_flight -= 1
+                self.in_flight_condition.notify_all()
+
+    def reload(self):
+        """
+        Starts a new server process on the same listening socket (on SIGHUP). Once it accepts connections
+        this process stops accepting, lets in-flight requests finish and passes its hit counts over.
+        """
+        if self.handoff is not None:
+            print("Reload already in progress")
+            return
+
+        parent_end, child_end = socket.socketpair()
+        env = {
+            **os.environ,
+            self.listen_fd_env: str(self.sock.fileno()),
+            self.handoff_fd_env: str(child_end.fileno()),
+        }
+        print("Reloading: starting", " ".join([sys.executable] + sys.argv))
+        process = subprocess.Popen([sys.executable] + sys.argv, env=env,
+                                   pass_fds=(self.sock.fileno(), child_end.fileno()))
+        child_end.close()
+
+        parent_end.settimeout(30)
+        try:
+            ready = parent_end.recv(16)
+        except OSError:
+            ready = b""
+
+        if ready != b"ready":
+            print("New process did not start, keep serving")
+            process.kill()
+            parent_end.close()
+            return
+
+        self.handoff = parent_end
+        self.accepting = False
+
+    def drain(self):
+        with self.in_flight_condition:
+            print(f"Stopped accepting, waiting for {self.in_flight} connections")
+            self.in_flight_condition.wait_for(lambda: self.in_flight == 0, timeout=self.drain_timeout)
+            remaining = self.in_flight
+
+        # the hit counts include everything this process served
+        self.handoff.settimeout(None)
+        self.handoff.sendall(json.dumps(self.hit_counter.export_state()).encode())
+        self.handoff.close()
+
+        if self.recorder is not None:
+            self.recorder.close()
+
+        if remaining:
+            print(f"Drain deadline passed, dropping {remaining} connections")
+            os._exit(0)
+        print("Drained, exiting")
+
+    def finish_takeover(self, handoff_fd):
+        handoff = socket.socket(fileno=handoff_fd)
+        handoff.sendall(b"ready")
+
+        def receive_hit_counts():
+            data = b""
+            while chunk := handoff.recv(65536):
+                data += chunk
+            handoff.close()
+            if data:
+                self.hit_counter.merge_state(json.loads(data))
+                print("Hit counts taken over from the previous process")
+
+        Thread(target=receive_hit_counts, daemon=True).start()
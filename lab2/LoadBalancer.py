@@ -0,0 +1,113 @@
+import bisect
+import hashlib
+import threading
+import time
+
+
+class Backend:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.active_connections = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+
+    @property
+    def name(self):
+        return f"{self.host}:{self.port}"
+
+    def is_available(self, now: float) -> bool:
+        return self.healthy and now >= self.ejected_until
+
+    def __repr__(self):
+        return f"Backend({self.name})"
+
+
+class LoadBalancer:
+    """
+    Picks a backend for every request and keeps track of their health.
+    Policies: "round-robin", "least-connections" and "consistent-hash" (by request path).
+
+    A backend is ejected for `ejection_seconds` after `max_failures` failed requests in a row,
+    and marked unhealthy/healthy again by the active health checks.
+    """
+
+    policies = ("round-robin", "least-connections", "consistent-hash")
+
+    def __init__(self, backends: list, policy: str = "round-robin", max_failures: int = 3,
+                 ejection_seconds: float = 30, virtual_nodes: int = 100):
+        if policy not in self.policies:
+            raise ValueError(f"policy must be one of {', '.join(self.policies)}")
+        if not backends:
+            raise ValueError("at least one backend is required")
+
+        self.backends = backends
+        self.policy = policy
+        self.max_failures = max_failures
+        self.ejection_seconds = ejection_seconds
+        self.lock = threading.Lock()
+        self.next_index = 0
+
+        # hash ring: sorted points, each owned by a backend
+        self.ring = sorted(
+            (self._hash(f"{backend.name}#{i}"), backend)
+            for backend in backends
+            for i in range(virtual_nodes)
+        )
+        self.ring_points = [point for point, _ in self.ring]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def choose(self, path: str, exclude=()):
+        """Returns a backend with its active connection count already incremented, or None if all are down."""
+        now = time.time()
+
+        with self.lock:
+            available = [b for b in self.backends if b.is_available(now) and b not in exclude]
+            if not available:
+                return None
+
+            if self.policy == "round-robin":
+                backend = available[self.next_index % len(available)]
+                self.next_index += 1
+            elif self.policy == "least-connections":
+                backend = min(available, key=lambda b: b.active_connections)
+            else:
+                backend = self._ring_lookup(path, available)
+
+            backend.active_connections += 1
+            return backend
+
+    def _ring_lookup(self, path: str, available: list):
+        # walk clockwise from the path's point until an available backend owns it
+        start = bisect.bisect(self.ring_points, self._hash(path))
+        for i in range(len(self.ring)):
+            backend = self.ring[(start + i) % len(self.ring)][1]
+            if backend in available:
+                return backend
+
+    def release(self, backend: Backend, success):
+        """success is None when the request ended for reasons that say nothing about the backend (e.g. the client left)."""
+        with self.lock:
+            backend.active_connections -= 1
+
+            if success is None:
+                return
+            if success:
+                backend.consecutive_failures = 0
+                return
+
+            backend.consecutive_failures += 1
+            if backend.consecutive_failures >= self.max_failures:
+                backend.ejected_until = time.time() + self.ejection_seconds
+                backend.consecutive_failures = 0
+                print(f"Ejecting {backend.name} for {self.ejection_seconds}s")
+
+    def set_health(self, backend: Backend, healthy: bool):
+        with self.lock:
+            if backend.healthy != healthy:
+                print(f"Backend {backend.name} is {'healthy' if healthy else 'unhealthy'}")
+            backend.healthy = healthy
@@ -0,0 +1,237 @@
+import socket
+import threading
+import time
+
+from client import HttpClient
+from HttpHelper import *
+from HttpServer import HtmlServer
+from LoadBalancer import Backend, LoadBalancer
+
+
+# headers that describe a single connection and must not be forwarded
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-connection", "te", "trailer", "upgrade",
+    "transfer-encoding", "content-length", "host", "expect",
+}
+
+
+def _canonical(header: str) -> str:
+    return "-".join(part.capitalize() for part in header.split("-"))
+
+
+class ProxyServer(HtmlServer):
+    """
+    Accepts requests like HtmlServer (thread pool, rate limiter) but forwards them to one of
+    several backends, reusing persistent HttpClient connections and streaming bodies both ways.
+    """
+
+    page_bad_request = build_http_response(400, b"<h1>400 Bad Request</h1>")
+    page_not_implemented = build_http_response(501, b"<h1>501 Not Implemented</h1>")
+    page_bad_gateway = build_http_response(502, b"<h1>502 Bad Gateway</h1>")
+    page_service_unavailable = build_http_response(503, b"<h1>503 Service Unavailable</h1>")
+
+    def __init__(self, backends, host="0.0.0.0", port=8080, policy="round-robin", requests_per_second=5,
+                 pool_size=10, backend_timeout=30, health_path="/", health_interval=5, shaper=None):
+        super().__init__(host=host, port=port, requests_per_second=requests_per_second, shaper=shaper)
+
+        self.balancer = LoadBalancer([Backend(h, p) for h, p in backends], policy=policy)
+        self.pool_size = pool_size
+        self.backend_timeout = backend_timeout
+        self.health_path = health_path
+        self.health_interval = health_interval
+
+        # idle keep-alive connections per backend
+        self.pools = {backend: [] for backend in self.balancer.backends}
+        self.pool_lock = threading.Lock()
+
+        print("Proxying to:", ", ".join(b.name for b in self.balancer.backends), f"({policy})")
+
+    def acquire_client(self, backend: Backend, pooled: bool = True) -> HttpClient:
+        if pooled:
+            with self.pool_lock:
+                pool = self.pools[backend]
+                if pool:
+                    return pool.pop()
+        return HttpClient(backend.host, backend.port, keep_alive=True, timeout=self.backend_timeout)
+
+    def release_client(self, backend: Backend, client: HttpClient):
+        if client.is_connected():
+            with self.pool_lock:
+                pool = self.pools[backend]
+                if len(pool) < self.pool_size:
+                    pool.append(client)
+                    return
+        client.close()
+
+    def handle_request(self, conn, addr):
+
+        if not self.filter.process(addr[0]):
+            self.send_too_many_requests(conn)
+            return
+
+        try:
+            head = receive_http_head(conn)
+        except OSError:
+            head = None
+
+        if not head:
+            conn.close()
+            return
+
+        first_line, headers, rest = head
+        parts = first_line.split(" ", 2)
+        if len(parts) != 3:
+            conn.close()
+            return
+        method, path, version = parts
+
+        # answered here, a request the backends could never get must not count against them
+        if method not in HttpClient.methods:
+            conn.sendall(self.page_not_implemented)
+            conn.close()
+            return
+
+        chunked = "chunked" in headers.get("transfer-encoding", "").lower()
+        content_length = headers.get("content-length", "0")
+        if not chunked and not (content_length.isascii() and content_length.isdigit()):
+            conn.sendall(self.page_bad_request)
+            conn.close()
+            return
+
+        forward_headers = {_canonical(k): v for k, v in headers.items() if k not in HOP_BY_HOP_HEADERS}
+        forwarded_for = headers.get("x-forwarded-for")
+        forward_headers["X-Forwarded-For"] = f"{forwarded_for}, {addr[0]}" if forwarded_for else addr[0]
+        if "host" in headers:
+            forward_headers["X-Forwarded-Host"] = headers["host"]
+
+        # request bodies are streamed through as well; a client waiting for 100 Continue gets it
+        # from us, the backend sees a plain request
+        body = b""
+        if headers.get("expect", "").lower() == "100-continue" and (chunked or int(content_length) > 0):
+            conn.sendall(b"HTTP/1.1 100 Continue\r\n\r\n")
+        if chunked:
+            body = ClientBody(iter_chunked_encoding(iter_http_body(conn, headers, rest)))
+            forward_headers["Transfer-Encoding"] = "chunked"
+        elif int(content_length) > 0:
+            body = ClientBody(iter_http_body(conn, headers, rest))
+            forward_headers["Content-Length"] = headers["content-length"]
+
+        try:
+            self.proxy(conn, addr[0], method, path, body, forward_headers)
+        finally:
+            conn.close()
+
+    def proxy(self, conn, ip, method, path, body, headers):
+        # requests without a body can be sent to another backend when one is unreachable
+        tried = []
+        while True:
+            backend = self.balancer.choose(path, exclude=tried)
+            if backend is None:
+                conn.sendall(self.page_bad_gateway if tried else self.page_service_unavailable)
+                return
+
+            client = None
+            success = False
+            try:
+                client, response = self.forward(backend, method, path, body, headers)
+                if response is None:
+                    tried.append(backend)
+                    if isinstance(body, bytes):
+                        continue
+                    conn.sendall(self.page_bad_gateway)
+                    return
+
+                status_code, status_text, response_headers, chunks = response
+                success = self.relay_response(conn, ip, status_code, status_text, response_headers, chunks)
+                if success:
+                    self.release_client(backend, client)
+                    client = None
+                return
+            except (OSError, ValueError) as e:
+                # the backend's errors are handled in forward, these come from the client: its connection
+                # went away or its request body is malformed, the backend is not to blame
+                print("Proxy error:", e)
+                success = None
+                if isinstance(e, ValueError):
+                    try:
+                        conn.sendall(self.page_bad_request)
+                    except OSError:
+                        pass
+                return
+            finally:
+                if client is not None:
+                    client.close()
+                self.balancer.release(backend, success)
+
+    def forward(self, backend, method, path, body, headers):
+        """
+        Sends the request to the backend, returns (client, response) where response is None if the backend
+        could not be reached or failed to answer. Errors reading the client's request body are raised.
+        """
+        # a pooled connection may have been closed by the backend in the meantime: requests without
+        # a streamed body are safe to retry once on a fresh one, a streamed body can only be read once
+        # so it always goes over a fresh connection
+        replayable = isinstance(body, bytes)
+        attempts = 2 if replayable else 1
+
+        for attempt in range(attempts):
+            client = self.acquire_client(backend, pooled=replayable)
+            reused = client.is_connected()
+            try:
+                return client, client.stream(path, method, body=body, headers=headers)
+            except OSError as e:
+                client.close()
+                if getattr(body, "failed", False):
+                    raise
+                if not reused or attempt == attempts - 1:
+                    print(f"Backend {backend.name} failed: {e}")
+                    return client, None
+
+        return None, None
+
+    def relay_response(self, conn, ip, status_code, status_text, headers, chunks) -> bool:
+        """Streams the backend response to the client, returns False if the backend failed mid-way."""
+        response_headers = {_canonical(k): v for k, v in headers.items() if k not in HOP_BY_HOP_HEADERS}
+
+        if "content-length" in headers:
+            response_headers["Content-Length"] = headers["content-length"]
+        elif status_code not in ("204", "304"):
+            response_headers["Transfer-Encoding"] = "chunked"
+            chunks = iter_chunked_encoding(chunks)
+        response_headers["Connection"] = "close"
+
+        headers_text = "".join(f"{k}: {v}\r\n" for k, v in response_headers.items())
+        conn.sendall(f"HTTP/1.1 {status_code} {status_text}\r\n{headers_text}\r\n".encode())
+
+        while True:
+            try:
+                chunk = next(chunks, None)
+            except OSError as e:
+                print("Backend closed mid-response:", e)
+                return False
+
+            if chunk is None:
+                return not status_code.startswith("5")
+
+            try:
+                self.shaper.sendall(conn, ip, chunk, headers.get("content-type"))
+            except OSError:
+                # the client went away, the backend is fine but its connection is unusable now
+                chunks.close()
+                return True
+
+    def health_check_loop(self):
+        while True:
+            for backend in self.balancer.backends:
+                client = HttpClient(backend.host, backend.port, timeout=self.backend_timeout)
+                try:
+                    _, _, status_code = client.request(self.health_path, "GET")
+                    healthy = not status_code.startswith("5")
+                except (OSError, ValueError):
+                    healthy = False
+                self.balancer.set_health(backend, healthy)
+            time.sleep(self.health_interval)
+
+    def serve_forever(self):
+        threading.Thread(target=self.health_check_loop, daemon=True).start()
+        super().serve_forever()
@@ -0,0 +1,148 @@
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def time_until(self, amount: int) -> float:
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+
+class EgressShaper:
+    """
+    Limits how fast responses are sent, in bytes per second: per client IP, for all clients together
+    and per content type (prefixes such as "image/" or "application/pdf"). Any limit may be None.
+
+    Bodies are sent in pieces of `quantum` bytes. Transfers waiting for bytes take turns one piece
+    at a time (round-robin, skipping those whose own limits are exhausted), so a small page is not
+    stuck behind a large download.
+    """
+
+    max_idle_buckets = 1024
+
+    def __init__(self, global_rate=None, per_ip_rate=None, content_type_rates=None, quantum: int = 16 * 1024,
+                 burst_seconds: float = 0.5):
+        self.per_ip_rate = per_ip_rate
+        self.content_type_rates = content_type_rates or {}
+        self.quantum = quantum
+        self.burst_seconds = burst_seconds
+
+        self.global_bucket = self._bucket(global_rate) if global_rate else None
+        self.ip_buckets = {}
+        self.type_buckets = {prefix: self._bucket(rate) for prefix, rate in self.content_type_rates.items()}
+
+        self.lock = threading.Lock()
+        self.waiting = []  # [(condition, buckets, amount)] in turn order, each waiting thread has its own condition
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.global_bucket or self.per_ip_rate or self.type_buckets)
+
+    def _bucket(self, rate: float) -> TokenBucket:
+        # a piece must always fit in the bucket
+        return TokenBucket(rate, max(rate * self.burst_seconds, self.quantum))
+
+    def sendall(self, conn, ip: str, data: bytes, content_type: str = None):
+        if not self.enabled:
+            conn.sendall(data)
+            return
+
+        view = memoryview(data)
+        for start in range(0, len(view), self.quantum):
+            piece = view[start:start + self.quantum]
+            self.acquire(ip, content_type, len(piece))
+            conn.sendall(piece)
+
+    def sendfile(self, conn, ip: str, file, count: int, content_type: str = None, offset: int = 0):
+        if not self.enabled:
+            conn.sendfile(file, offset=offset, count=count)
+            return
+
+        for position in range(offset, offset + count, self.quantum):
+            size = min(self.quantum, offset + count - position)
+            self.acquire(ip, content_type, size)
+            conn.sendfile(file, offset=position, count=size)
+
+    def acquire(self, ip: str, content_type: str, amount: int):
+        """
+        Blocks until it is this transfer's turn and every limit it falls under allows `amount` bytes.
+
+        Only one thread is woken per change: the one whose turn it is, or, when nobody can send yet,
+        the first in line, which waits for the tokens to refill on behalf of everyone else.
+        """
+        with self.lock:
+            buckets = self._buckets_for(ip, content_type)
+            entry = (threading.Condition(self.lock), buckets, amount)
+            self.waiting.append(entry)
+
+            while True:
+                chosen, wait = self._next_turn(time.monotonic())
+
+                if chosen is entry:
+                    for bucket in buckets:
+                        bucket.tokens -= amount
+                    self.waiting.remove(entry)
+                    self._wake_next()
+                    return
+
+                if chosen is not None:
+                    chosen[0].notify()
+                elif self.waiting[0] is not entry:
+                    self.waiting[0][0].notify()
+                entry[0].wait(timeout=wait if self.waiting[0] is entry else None)
+
+    def _wake_next(self):
+        if not self.waiting:
+            return
+        chosen, _ = self._next_turn(time.monotonic())
+        (chosen or self.waiting[0])[0].notify()
+
+    def _next_turn(self, now: float):
+        """The first waiting transfer that can send now, or None and how long until one might."""
+        wait = None
+        for entry in self.waiting:
+            _, buckets, amount = entry
+            for bucket in buckets:
+                bucket.refill(now)
+            delay = max((bucket.time_until(amount) for bucket in buckets), default=0.0)
+            if delay == 0:
+                return entry, None
+            wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    def _buckets_for(self, ip: str, content_type: str) -> list:
+        buckets = []
+        if self.global_bucket:
+            buckets.append(self.global_bucket)
+
+        if self.per_ip_rate:
+            if ip not in self.ip_buckets:
+                if len(self.ip_buckets) >= self.max_idle_buckets:
+                    self._forget_full_buckets()
+                self.ip_buckets[ip] = self._bucket(self.per_ip_rate)
+            buckets.append(self.ip_buckets[ip])
+
+        if content_type:
+            for prefix, bucket in self.type_buckets.items():
+                if content_type.startswith(prefix):
+                    buckets.append(bucket)
+
+        return buckets
+
+    def _forget_full_buckets(self):
+        # a full bucket carries no information, a new one for that IP would start the same way
+        now = time.monotonic()
+        in_use = {id(bucket) for _, buckets, _ in self.waiting for bucket in buckets}
+        for ip, bucket in list(self.ip_buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.burst and id(bucket) not in in_use:
+                del self.ip_buckets[ip]
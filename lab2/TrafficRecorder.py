@@ -0,0 +1,48 @@
+import gzip
+import json
+import os
+import time
+
+
+class TrafficRecorder:
+    """
+    Appends every request the server receives to a JSON-lines file: arrival time, client IP,
+    method, path and headers (credentials left out). replay.py plays such a file back.
+
+    Each line goes out in a single append-mode write, so the processes before and after
+    a reload can share the file.
+    """
+
+    skipped_headers = ("authorization", "cookie")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def record(self, arrived: float, ip: str, method: str, path: str, headers: dict):
+        entry = {
+            "t": round(arrived, 6),
+            "ip": ip,
+            "m": method,
+            "p": path,
+            "h": {k: v for k, v in headers.items() if k not in self.skipped_headers},
+        }
+        os.write(self.fd, (json.dumps(entry, separators=(",", ":")) + "\n").encode())
+
+    def close(self):
+        os.close(self.fd)
+
+
+def read_records(path: str) -> list:
+    """Records sorted by arrival time, the file may also be gzip-compressed (.gz)."""
+    opener = gzip.open if path.endswith(".gz") else open
+    records = []
+    with opener(path, "rt") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # a line cut short when the server was killed
+                continue
+    records.sort(key=lambda record: record["t"])
+    return records
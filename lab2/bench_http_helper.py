@@ -0,0 +1,192 @@
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+
+from FileHelper import parse_args
+from HttpHelper import _receive_http_common, build_http_request, build_http_response, get_content_type
+
+# not committed, each machine keeps its own
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+# request as sent by a browser
+BROWSER_GET = (
+    b"GET /utm/Anul%20III%202025%20Semestrul%20V%205.pdf HTTP/1.1\r\n"
+    b"Host: localhost:8080\r\n"
+    b"Connection: keep-alive\r\n"
+    b"sec-ch-ua: \"Chromium\";v=\"141\", \"Not?A_Brand\";v=\"8\"\r\n"
+    b"sec-ch-ua-mobile: ?0\r\n"
+    b"sec-ch-ua-platform: \"Windows\"\r\n"
+    b"Upgrade-Insecure-Requests: 1\r\n"
+    b"User-Agent: Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36\r\n"
+    b"Accept: text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8\r\n"
+    b"Sec-Fetch-Site: same-origin\r\n"
+    b"Sec-Fetch-Mode: navigate\r\n"
+    b"Sec-Fetch-Dest: document\r\n"
+    b"Referer: http://localhost:8080/utm/\r\n"
+    b"Accept-Encoding: gzip, deflate, br, zstd\r\n"
+    b"Accept-Language: en-US,en;q=0.9,ro;q=0.8\r\n"
+    b"\r\n"
+)
+
+# request as sent by client.py
+CLIENT_GET = build_http_request("GET", "/spiderman.html", "localhost")
+
+
+def _response(size: int) -> bytes:
+    return build_http_response(200, bytes(i % 251 for i in range(size)), headers={"Content-Type": "application/pdf"})
+
+
+class FakeSocket:
+    """Replays a byte stream, handing out at most `fragment` bytes per recv like a slow network would."""
+
+    def __init__(self, data: bytes, fragment: int = None):
+        self.data = memoryview(data)
+        self.fragment = fragment
+        self.position = 0
+
+    def recv(self, size: int) -> bytes:
+        if self.fragment:
+            size = min(size, self.fragment)
+        chunk = self.data[self.position:self.position + size]
+        self.position += len(chunk)
+        return bytes(chunk)
+
+
+def _receive_over_socketpair(data: bytes):
+    reader, writer = socket.socketpair()
+    sender = threading.Thread(target=writer.sendall, args=(data,))
+    sender.start()
+    try:
+        return _receive_http_common(reader)
+    finally:
+        sender.join()
+        reader.close()
+        writer.close()
+
+
+def build_cases() -> dict:
+    response_1k = _response(1024)
+    response_64k = _response(64 * 1024)
+    response_4m = _response(4 * 1024 * 1024)
+    body_4m = response_4m.split(b"\r\n\r\n", 1)[1]
+    paths = ["/index.html", "/served/utm/Anul III 2025 Semestrul V 5.pdf", "/fiction/pulp.png", "/file.md", "/noext"]
+
+    return {
+        "receive_request_browser": lambda: _receive_http_common(FakeSocket(BROWSER_GET)),
+        "receive_request_client": lambda: _receive_http_common(FakeSocket(CLIENT_GET)),
+        "receive_request_fragmented_7b": lambda: _receive_http_common(FakeSocket(BROWSER_GET, fragment=7)),
+        "receive_response_1k": lambda: _receive_http_common(FakeSocket(response_1k)),
+        "receive_response_64k_mtu": lambda: _receive_http_common(FakeSocket(response_64k, fragment=1448)),
+        "receive_response_4m_mtu": lambda: _receive_http_common(FakeSocket(response_4m, fragment=1448)),
+        "receive_response_4m_socketpair": lambda: _receive_over_socketpair(response_4m),
+        "build_response_small": lambda: build_http_response(200, b"<h1>hello</h1>"),
+        "build_response_4m": lambda: build_http_response(200, body_4m, headers={"Content-Type": "application/pdf"}),
+        "build_request": lambda: build_http_request("GET", "/spiderman.html", "localhost", headers={"Range": "bytes=0-0"}),
+        "get_content_type": lambda: [get_content_type(path) for path in paths],
+    }
+
+
+def measure(operation, min_time: float, repeat: int = 5) -> dict:
+    # warm up, then run in growing batches; the best of several rounds is the least disturbed by noise
+    operation()
+
+    best = 0
+    ops = 0
+    for _ in range(repeat):
+        ops = 0
+        batch = 1
+        start = time.perf_counter()
+        while True:
+            for _ in range(batch):
+                operation()
+            ops += batch
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time / repeat:
+                break
+            batch *= 2
+        best = max(best, ops / elapsed)
+
+    # memory allocated on top of what was live before the call, measured separately
+    # because tracing slows everything down
+    samples = max(1, min(ops, 20))
+    tracemalloc.start()
+    try:
+        peak_total = 0
+        for _ in range(samples):
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            operation()
+            _, peak = tracemalloc.get_traced_memory()
+            peak_total += peak - current
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "ops_per_sec": best,
+        "peak_bytes_per_op": peak_total / samples,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if result["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+            regressions.append(f"{name}: {result['ops_per_sec']:.0f} ops/s vs {base['ops_per_sec']:.0f} baseline")
+        if result["peak_bytes_per_op"] > base["peak_bytes_per_op"] * (1 + threshold) + 1024:
+            regressions.append(f"{name}: {result['peak_bytes_per_op']:.0f} B/op vs {base['peak_bytes_per_op']:.0f} baseline")
+    return regressions
+
+
+def main():
+    args = parse_args()
+    min_time = float(args.get("min-time", 1))
+    threshold = float(args.get("threshold", 0.2))
+    only = args.get("filter")
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+
+    results = {}
+    print(f"{'benchmark':34} {'ops/sec':>12} {'baseline':>12} {'change':>8} {'peak B/op':>12}")
+    for name, operation in build_cases().items():
+        if only and only not in name:
+            continue
+
+        result = measure(operation, min_time)
+        results[name] = result
+
+        base = baseline.get(name)
+        base_ops = f"{base['ops_per_sec']:12.0f}" if base else f"{'-':>12}"
+        change = f"{result['ops_per_sec'] / base['ops_per_sec'] - 1:+8.1%}" if base else f"{'-':>8}"
+        print(f"{name:34} {result['ops_per_sec']:12.0f} {base_ops} {change} "
+              f"{result['peak_bytes_per_op']:12.0f}")
+
+    # numbers depend on the machine, cases measured for the first time here (e.g. on the first run) become the baseline
+    new = {name: result for name, result in results.items() if name not in baseline}
+    if "save-baseline" in args or new:
+        baseline.update(results if "save-baseline" in args else new)
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print("Baseline saved to", BASELINE_PATH)
+        if "save-baseline" in args:
+            return
+
+    regressions = compare(results, baseline, threshold)
+    if regressions:
+        print(f"\nRegressions (more than {threshold:.0%} worse than baseline):")
+        for regression in regressions:
+            print("  " + regression)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
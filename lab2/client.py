@@ -2,22 +2,38 @@ import socket
 import ssl
 import sys
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse, unquote, quote
 
 from FileHelper import parse_args
-from HttpHelper import build_http_request, receive_from_http_socket
+from HttpCache import HttpCache
+from HttpHelper import build_http_request, receive_http_head, iter_http_body
+
+
+SEGMENT_MAX_BYTES = 8 * 1024 * 1024
 
 
 class HttpClient:
-    def __init__(self, host, port=80, https=False):
+    methods = ("GET", "HEAD", "POST", "PUT", "DELETE")
+
+    def __init__(self, host, port=80, https=False, keep_alive=False, timeout=None, cache=None, source_address=None):
         self.host = host
         self.port = port
         self.https = https
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.cache = cache
+        # local IP to connect from, e.g. one of 127.0.0.0/8 to look like a different client
+        self.source_address = source_address
         self.client_socket = None
 
     def init_socket(self):
 
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        if self.source_address:
+            sock.bind((self.source_address, 0))
 
         if self.https:
             context = ssl.create_default_context()
@@ -25,51 +41,283 @@ class HttpClient:
         else:
             self.client_socket = sock
 
+    def connect(self):
+        self.init_socket()
+        self.client_socket.connect((self.host, self.port))
+
+    def close(self):
+        if self.client_socket is not None:
+            self.client_socket.close()
+            self.client_socket = None
+
+    def is_connected(self):
+        return self.client_socket is not None
+
     def request(self, url: str, method: str = "GET", body=b"", headers=None):
-        if headers is None:
-            headers = {}
+        if self.cache is not None and method == "GET" and "Range" not in (headers or {}):
+            return self.cached_request(url, headers)
 
-        self.init_socket()
+        status_code, status_text, response_headers, chunks = self.stream(url, method, body, headers)
+        response_body = b"".join(chunks)
+
+        return response_headers, response_body, status_code
+
+    def cached_request(self, url: str, headers=None):
+        """GET through the cache: fresh entries skip the network, stale ones are revalidated."""
+        key = f"{'https' if self.https else 'http'}://{self.host}:{self.port}{url}"
+        cached = self.cache.lookup(key)
+
+        request_headers = headers
+        if cached is not None:
+            entry, cached_body = cached
+            if self.cache.is_fresh(entry):
+                self.cache.record("hits")
+                return entry["headers"], cached_body, "200"
+            request_headers = {**self.cache.conditional_headers(entry), **(headers or {})}
+
+        status_code, status_text, response_headers, chunks = self.stream(url, "GET", headers=request_headers)
+        response_body = b"".join(chunks)
+
+        if status_code == "304" and cached is not None:
+            entry = self.cache.refresh(key, response_headers)
+            if entry is not None:
+                self.cache.record("revalidated")
+                return entry["headers"], cached_body, "200"
+
+            # evicted in the meantime, ask for the full response
+            status_code, status_text, response_headers, chunks = self.stream(url, "GET", headers=headers)
+            response_body = b"".join(chunks)
 
-        with self.client_socket:
+        self.cache.record("misses")
+        if status_code == "200":
+            self.cache.store(key, response_headers, response_body)
 
-            self.client_socket.connect((self.host, self.port))
+        return response_headers, response_body, status_code
+
+    def stream(self, url: str, method: str = "GET", body=b"", headers=None, chunk_size: int = 65536):
+        """
+        Sends the request and returns (status_code, status_text, headers, chunks) as soon as the headers arrive.
+        chunks is a generator over the body; with keep_alive the connection stays open for the next
+        request once it is exhausted, otherwise it is closed.
+        """
+        if headers is None:
+            headers = {}
+
+        if method not in self.methods:
+            raise ValueError(f"method must be one of {', '.join(self.methods)}")
 
-            if method not in ("GET", "POST", "PUT", "DELETE"):
-                raise ValueError("method must be GET, POST, PUT, or DELETE")
+        if self.client_socket is None:
+            self.connect()
 
-            # Build and send the HTTP request
+        try:
+            # Build and send the HTTP request, a body that is not bytes is an iterable of pieces
+            # whose length is given by the caller in Content-Length or Transfer-Encoding headers
+            streamed_body = not isinstance(body, (bytes, bytearray))
             request = build_http_request(
                 method=method,
                 path=url,
-                body=body,
-                headers=headers,
+                body=b"" if streamed_body else body,
+                headers={"Connection": "keep-alive" if self.keep_alive else "close", **headers},
                 host=self.host
             )
             self.client_socket.sendall(request)
+            if streamed_body:
+                for piece in body:
+                    self.client_socket.sendall(piece)
 
-            _, status_code, version, response_headers, response_body = receive_from_http_socket(self.client_socket, "response")
+            # interim responses (100 Continue, 103 Early Hints) come before the real one and have no body
+            rest = b""
+            while True:
+                head = receive_http_head(self.client_socket, rest)
+                if head is None:
+                    raise ConnectionError("connection closed before a response was received")
 
-            self.client_socket.close()
+                first_line, response_headers, rest = head
+                parts = first_line.split(" ", 2)
+                if len(parts) < 2:
+                    raise ConnectionError(f"malformed status line: {first_line!r}")
+                version, status_code = parts[0], parts[1]
+                status_text = parts[2] if len(parts) == 3 else ""
 
-        return response_headers, response_body, status_code
+                if not status_code.startswith("1"):
+                    break
+                if status_code == "101":
+                    # we never ask to upgrade, the connection no longer speaks HTTP
+                    raise ConnectionError("unexpected 101 Switching Protocols")
+        except Exception:
+            self.close()
+            raise
+
+        reusable = (
+            self.keep_alive
+            and version == "HTTP/1.1"
+            and response_headers.get("connection", "").lower() != "close"
+        )
+        has_body = method != "HEAD" and status_code not in ("204", "304")
+
+        return status_code, status_text, response_headers, self._body_chunks(
+            response_headers, rest, has_body, reusable, chunk_size
+        )
+
+    def _body_chunks(self, headers, rest, has_body, reusable, chunk_size):
+        sock = self.client_socket
+        try:
+            if has_body:
+                # a response without length or chunking ends when the server closes
+                delimited = "content-length" in headers or "chunked" in headers.get("transfer-encoding", "").lower()
+                yield from iter_http_body(sock, headers, rest, chunk_size=chunk_size, until_close=not delimited)
+                reusable = reusable and delimited
+        except BaseException:
+            reusable = False
+            raise
+        finally:
+            if not reusable and self.client_socket is sock:
+                self.close()
+
+    def download(self, url: str, save_path: str, segments: int = 4, retries: int = 3):
+        """
+        Downloads url into save_path over several connections at once, each fetching its own byte range.
+        Falls back to a single stream when the server does not answer range requests with 206.
+        :return: headers of the probe response
+        """
+        headers, body, status_code = self.request(url, "GET", headers={"Range": "bytes=0-0"})
+
+        size = self._content_range_total(status_code, headers)
+        if status_code == "416" and headers.get("content-range", "").strip() == "bytes */0":
+            # even the first byte is out of range: the file is empty
+            size = 0
+
+        if size is None and status_code != "200":
+            raise ConnectionError(f"download of {url} failed with status {status_code}")
+
+        os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
+
+        # everything goes to a temporary file first, save_path only ever holds a complete download
+        temp_path = f"{save_path}.part"
+        try:
+            if size is None:
+                # no range support, the probe already received the whole file
+                with open(temp_path, "wb") as f:
+                    f.write(body)
+            else:
+                self._download_segments(url, temp_path, size, headers, segments, retries)
+            os.replace(temp_path, save_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        return headers
+
+    def _download_segments(self, url, path, size, headers, segments, retries):
+        # preallocate so every segment can be written at its own offset
+        with open(path, "wb") as f:
+            f.truncate(size)
+
+        # make sure all segments come from the same version of the file
+        validator = headers.get("etag") or headers.get("last-modified")
+        segment_headers = {"If-Range": validator} if validator else {}
+
+        with ThreadPoolExecutor(max_workers=max(1, segments)) as executor:
+            futures = [
+                executor.submit(self._download_segment, url, path, start, end, segment_headers, retries)
+                for start, end in self._split_ranges(size, segments)
+            ]
+            for future in futures:
+                future.result()
+
+    def _download_segment(self, url, save_path, start, end, headers, retries):
+        # pieces are written at their offset as they arrive, a retry continues after the last byte written
+        position = start
+        last_error = None
+        fd = os.open(save_path, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+        try:
+            for attempt in range(retries):
+                # a fresh client per segment, sockets are not shared between threads
+                client = HttpClient(self.host, self.port, https=self.https)
+                try:
+                    status_code, _, response_headers, chunks = client.stream(
+                        url, "GET", headers={**headers, "Range": f"bytes={position}-{end}"}
+                    )
+                    if status_code != "206":
+                        raise ValueError(f"expected 206 for bytes {position}-{end}, got {status_code}")
+                    if not response_headers.get("content-range", "").startswith(f"bytes {position}-"):
+                        raise ValueError(f"unexpected Content-Range {response_headers.get('content-range')!r}")
+
+                    for chunk in chunks:
+                        chunk = chunk[:end + 1 - position]
+                        self._write_at(fd, chunk, position)
+                        position += len(chunk)
+
+                    if position != end + 1:
+                        raise ValueError(f"short segment {start}-{end}: stopped at {position}")
+                    return
+                except (OSError, ValueError) as e:
+                    last_error = e
+                    print(f"Segment {start}-{end} failed at {position} ({attempt + 1}/{retries}): {e}")
+                    time.sleep(0.5 * (attempt + 1))
+                finally:
+                    client.close()
+        finally:
+            os.close(fd)
+
+        raise ConnectionError(f"segment {start}-{end} failed after {retries} attempts") from last_error
+
+    @staticmethod
+    def _write_at(fd, data, offset):
+        view = memoryview(data)
+        while view:
+            if hasattr(os, "pwrite"):
+                written = os.pwrite(fd, view, offset)
+            else:
+                # Windows: the descriptor belongs to this segment only, so seeking is safe
+                os.lseek(fd, offset, os.SEEK_SET)
+                written = os.write(fd, view)
+            view = view[written:]
+            offset += written
+
+    @staticmethod
+    def _content_range_total(status_code, headers):
+        """Total size from a 'Content-Range: bytes 0-0/1234' header, or None if the range was not honored."""
+        content_range = headers.get("content-range", "")
+        if status_code != "206" or "/" not in content_range:
+            return None
+        total = content_range.rsplit("/", 1)[1].strip()
+        return int(total) if total.isdigit() else None
+
+    @staticmethod
+    def _split_ranges(size: int, segments: int):
+        """Inclusive (start, end) byte ranges, at least `segments` of them and none larger than SEGMENT_MAX_BYTES."""
+        if size == 0:
+            return []
+        count = max(1, segments, -(-size // SEGMENT_MAX_BYTES))
+        step = -(-size // count)
+        return [(start, min(start + step, size) - 1) for start in range(0, size, step)]
 
 
 def main():
 
     args = parse_args()
 
-    host, port, filename, download_path, https = (
+    host, port, filename, download_path, https, segments, cache_dir = (
         args.get("host", "localhost"),
         int(args.get("port", 8080)),
         quote(args.get("fname", "/")),
         args.get("dpath", "."),
-        bool(int(args.get("https", 0)))
+        bool(int(args.get("https", 0))),
+        int(args.get("segments", 1)),
+        args.get("cache")
     )
 
-    client = HttpClient(host, port, https=https)
+    cache = HttpCache(cache_dir, max_bytes=int(args.get("cache-size", 100 * 1024 * 1024))) if cache_dir else None
+    client = HttpClient(host, port, https=https, cache=cache)
 
-    headers, body_bytes = client.request(filename, "GET")
+    if segments > 1:
+        save_path = os.path.join(download_path, unquote(os.path.basename(filename)) or "downloaded_file")
+        client.download(filename, save_path, segments=segments)
+        print(f"Downloaded to: {save_path}")
+        return
+
+    headers, body_bytes, status_code = client.request(filename, "GET")
     content_type = headers.get("content-type")
 
     print("Content-Type:", content_type)
@@ -89,6 +337,11 @@ def main():
     else:
         print("Unknown file type:", content_type)
 
+    if cache is not None:
+        cache.save()
+        if "cache-stats" in args:
+            print(cache.stats())
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,147 @@
+import ipaddress
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from client import HttpClient
+from FileHelper import parse_args
+from TrafficRecorder import read_records
+
+# headers that belong to the original connection, HttpClient sets its own
+CONNECTION_HEADERS = ("host", "connection", "keep-alive", "content-length", "transfer-encoding", "expect")
+
+
+class Replayer:
+    """
+    Plays recorded requests against a server with their original spacing divided by speed
+    (speed 0 sends them as fast as possible). Against a loopback target every recorded client IP
+    connects from its own 127.x.y.z address, so the per-IP rate limiter sees the same clients.
+    """
+
+    def __init__(self, records: list, speed: float = 1.0, max_workers: int = 200, timeout: float = 30):
+        self.records = records
+        self.speed = speed
+        self.max_workers = max_workers
+        self.timeout = timeout
+
+        # 127.0.0.1 is left to local tools, recorded clients get 127.0.0.2 onwards
+        ips = sorted({record["ip"] for record in records})
+        self.source_addresses = {ip: str(ipaddress.IPv4Address("127.0.0.2") + i) for i, ip in enumerate(ips)}
+
+    def run(self, host: str, port: int) -> list:
+        """Returns one result per record: (index, status or None, latency in seconds, error or None)."""
+        use_sources = ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+        if not use_sources:
+            print("Target is not on loopback, all requests will come from this machine's address")
+
+        results = [None] * len(self.records)
+        start = time.perf_counter()
+        first = self.records[0]["t"] if self.records else 0
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for index, record in enumerate(self.records):
+                if self.speed > 0:
+                    delay = (record["t"] - first) / self.speed - (time.perf_counter() - start)
+                    if delay > 0:
+                        time.sleep(delay)
+                source = self.source_addresses[record["ip"]] if use_sources else None
+                executor.submit(self.send, results, index, record, host, port, source)
+
+        return results
+
+    def send(self, results, index, record, host, port, source):
+        headers = {k: v for k, v in record["h"].items() if k not in CONNECTION_HEADERS}
+        body = b""
+        if record["m"] in ("PUT", "POST"):
+            body = bytes(int(record["h"].get("content-length", "0")))
+
+        client = HttpClient(host, port, timeout=self.timeout, source_address=source)
+        sent = time.perf_counter()
+        try:
+            _, _, status_code = client.request(record["p"], record["m"], body=body, headers=headers)
+            results[index] = (index, status_code, time.perf_counter() - sent, None)
+        except (OSError, ValueError) as e:
+            results[index] = (index, None, time.perf_counter() - sent, type(e).__name__)
+        finally:
+            client.close()
+
+
+def _percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summarize(results: list) -> dict:
+    latencies = [latency for _, status, latency, _ in results if status is not None]
+    statuses = {}
+    for _, status, _, error in results:
+        key = status or error
+        statuses[key] = statuses.get(key, 0) + 1
+    errors = sum(1 for _, status, _, _ in results if status is None or status.startswith("5"))
+
+    return {
+        "requests": len(results),
+        "statuses": statuses,
+        "error_rate": errors / len(results) if results else 0.0,
+        "p50": _percentile(latencies, 0.5),
+        "p90": _percentile(latencies, 0.9),
+        "p99": _percentile(latencies, 0.99),
+        "max": max(latencies, default=0.0),
+    }
+
+
+def print_report(targets: list, summaries: list, all_results: list):
+    print()
+    print(f"{'':14}" + "".join(f"{target:>22}" for target in targets))
+    formats = {"requests": "", "error_rate": ".1%", "p50": ".3f", "p90": ".3f", "p99": ".3f", "max": ".3f"}
+    for name, spec in formats.items():
+        print(f"{name:14}" + "".join(f"{format(summary[name], spec):>22}" for summary in summaries))
+
+    statuses = sorted({key for summary in summaries for key in summary["statuses"]})
+    for status in statuses:
+        print(f"{'status ' + status:14}" + "".join(f"{s['statuses'].get(status, 0):>22}" for s in summaries))
+
+    if len(summaries) == 2:
+        a, b = summaries
+        print(f"\nDifference {targets[1]} vs {targets[0]}:")
+        for name in ("p50", "p90", "p99"):
+            change = (b[name] / a[name] - 1) if a[name] else 0.0
+            print(f"  {name}: {b[name] - a[name]:+.3f}s ({change:+.1%})")
+        print(f"  error rate: {b['error_rate'] - a['error_rate']:+.1%}")
+        differing = sum(1 for r1, r2 in zip(*all_results) if r1[1] != r2[1])
+        print(f"  requests answered with a different status: {differing}")
+
+
+def main():
+    args = parse_args()
+
+    records = read_records(args.get("file", "traffic.jsonl"))
+    if not records:
+        print("No requests recorded")
+        return
+
+    speed = float(args.get("speed", 1))
+    targets = args.get("targets", "localhost:8080").split(",")
+    replayer = Replayer(records, speed=speed, max_workers=int(args.get("workers", 200)))
+
+    duration = records[-1]["t"] - records[0]["t"]
+    print(f"Replaying {len(records)} requests from {len(replayer.source_addresses)} clients, "
+          f"recorded over {duration:.1f}s, at {'full speed' if speed <= 0 else f'{speed:g}x'}")
+
+    summaries, all_results = [], []
+    for target in targets:
+        host, port = target.rsplit(":", 1)
+        print(f"Target {target}...")
+        results = replayer.run(host, int(port))
+        summaries.append(summarize(results))
+        all_results.append(results)
+        # let per-second rate limits reset before the next target
+        time.sleep(1.1)
+
+    print_report(targets, summaries, all_results)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,8 @@ import os
 import sys
 
 from HttpServer import HtmlServer
+from Shaper import EgressShaper
+from ProxyServer import ProxyServer
 from FileHelper import parse_args
 
 if __name__ == "__main__":
@@ -11,7 +13,35 @@ if __name__ == "__main__":
     host = args.get('host', "0.0.0.0")
     port = int(args.get('port', 8080))
     dir = args.get("dir", "served/")
+    rps = int(args.get("rps", 5))
 
-    server = HtmlServer(port=port, host=host, served_directory=dir)
+    # byte rates, e.g. --egress-rate 10000000 --client-rate 1000000 --type-rates application/pdf=500000,image/=2000000
+    type_rates = {}
+    for type_rate in filter(None, args.get("type-rates", "").split(",")):
+        content_type, rate = type_rate.split("=", 1)
+        type_rates[content_type] = float(rate)
+    shaper = EgressShaper(
+        global_rate=float(args["egress-rate"]) if "egress-rate" in args else None,
+        per_ip_rate=float(args["client-rate"]) if "client-rate" in args else None,
+        content_type_rates=type_rates,
+    )
+
+    if "backends" in args:
+        # e.g. --backends 10.0.0.2:8080,10.0.0.3:8080 --policy least-connections
+        backends = []
+        for backend in args["backends"].split(","):
+            backend_host, backend_port = backend.rsplit(":", 1)
+            backends.append((backend_host, int(backend_port)))
+
+        server = ProxyServer(backends, port=port, host=host, requests_per_second=rps,
+                             policy=args.get("policy", "round-robin"), shaper=shaper)
+    else:
+        # --upload-auth user:password enables authenticated PUT/POST uploads
+        server = HtmlServer(port=port, host=host, served_directory=dir, requests_per_second=rps,
+                            upload_credentials=args.get("upload-auth"),
+                            max_upload_size=int(args.get("max-upload", 4 * 1024 ** 3)),
+                            record_path=args.get("record"), shaper=shaper,
+                            # --admin-auth user:password enables /_admin/stats
+                            admin_credentials=args.get("admin-auth"))
     server.serve_forever()
 
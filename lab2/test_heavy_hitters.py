@@ -0,0 +1,88 @@
+import math
+import random
+
+from HeavyHitters import CountMinSketch, SpaceSaving
+
+
+def zipf_stream(keys: int, length: int, seed: int):
+    """Paths requested with a long tail, like real traffic: a few hot ones and many rare ones."""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(keys)]
+    return rng.choices([f"/files/{i}.pdf" for i in range(keys)], weights=weights, k=length)
+
+
+def true_counts(stream):
+    counts = {}
+    for key in stream:
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def check_overcount(sketch, counts, total, label):
+    bound = math.e / sketch.width * total
+    overcounts = [sketch[key] - count for key, count in counts.items()]
+    within = sum(1 for overcount in overcounts if overcount <= bound) / len(overcounts)
+    print(f"{label}: max overcount {max(overcounts)}, bound {bound:.0f}, {within:.2%} of keys within it")
+
+    assert min(overcounts) >= 0, "a count-min sketch never undercounts"
+    # the bound holds for each key with probability 1 - e ** -depth
+    assert within >= 1 - math.exp(-sketch.depth)
+
+
+def test_overcount_bound():
+    stream = zipf_stream(keys=20000, length=200000, seed=1)
+    sketch = CountMinSketch(width=1024, depth=4)
+    for key in stream:
+        sketch.add(key)
+
+    check_overcount(sketch, true_counts(stream), len(stream), "Sketch")
+    assert sketch["/never/requested"] <= math.e / sketch.width * len(stream)
+
+
+def test_merge():
+    first = zipf_stream(keys=20000, length=100000, seed=2)
+    second = zipf_stream(keys=20000, length=100000, seed=3)
+
+    a, b = CountMinSketch(width=1024, depth=4), CountMinSketch(width=1024, depth=4)
+    for key in first:
+        a.add(key)
+    for key in second:
+        b.add(key)
+
+    # as if the sketch had travelled to another process
+    a.merge(CountMinSketch.from_dict(b.to_dict()))
+    check_overcount(a, true_counts(first + second), len(first) + len(second), "Merged sketch")
+
+    try:
+        a.merge(CountMinSketch(width=512, depth=4))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("merging sketches of different sizes must fail")
+
+
+def test_space_saving():
+    stream = zipf_stream(keys=20000, length=200000, seed=4)
+    counts = true_counts(stream)
+    top = SpaceSaving(k=64)
+    for key in stream:
+        top.add(key)
+
+    for key, count, error in top.top():
+        assert count - error <= counts[key] <= count
+
+    # every key seen more than total / k times is guaranteed to be tracked
+    frequent = [key for key, count in counts.items() if count > len(stream) / top.k]
+    assert all(key in top.counters for key in frequent)
+
+    true_top = sorted(counts, key=counts.get, reverse=True)[:10]
+    found = [key for key, _, _ in top.top(10)]
+    print(f"Space-saving: {len(frequent)} frequent keys tracked, top 10 matches {len(set(found) & set(true_top))}/10")
+    assert found[:3] == true_top[:3]
+
+
+if __name__ == "__main__":
+    test_overcount_bound()
+    test_merge()
+    test_space_saving()
+    print("All heavy hitter checks passed")
@@ -0,0 +1,111 @@
+import time
+
+from LoadBalancer import Backend, LoadBalancer
+
+PATHS = [f"/files/{i}.pdf" for i in range(10000)]
+
+
+def make_backends(count):
+    return [Backend("10.0.0.1", 8080 + i) for i in range(count)]
+
+
+def assignments(balancer):
+    result = {}
+    for path in PATHS:
+        backend = balancer.choose(path)
+        balancer.release(backend, True)
+        result[path] = backend.name
+    return result
+
+
+def test_ring_balance():
+    balancer = LoadBalancer(make_backends(3), policy="consistent-hash")
+    counts = {}
+    for name in assignments(balancer).values():
+        counts[name] = counts.get(name, 0) + 1
+
+    shares = sorted(count / len(PATHS) for count in counts.values())
+    print("Ring shares with 3 backends:", ", ".join(f"{share:.1%}" for share in shares))
+    assert len(counts) == 3
+    assert shares[0] > 0.25 and shares[-1] < 0.42
+
+
+def test_ring_stability_on_removal():
+    backends = make_backends(3)
+    balancer = LoadBalancer(backends, policy="consistent-hash")
+    before = assignments(balancer)
+
+    balancer.set_health(backends[1], False)
+    after = assignments(balancer)
+
+    moved = [path for path in PATHS if before[path] != after[path]]
+    print(f"Removing 1 of 3 backends moved {len(moved) / len(PATHS):.1%} of paths")
+    # only the paths of the removed backend move, the others keep their backend (and its caches)
+    assert all(before[path] == backends[1].name for path in moved)
+    assert all(after[path] != backends[1].name for path in PATHS)
+
+    balancer.set_health(backends[1], True)
+    assert assignments(balancer) == before
+
+
+def test_ring_stability_on_addition():
+    before = assignments(LoadBalancer(make_backends(3), policy="consistent-hash"))
+    backends = make_backends(4)
+    after = assignments(LoadBalancer(backends, policy="consistent-hash"))
+
+    moved = [path for path in PATHS if before[path] != after[path]]
+    print(f"Adding a 4th backend moved {len(moved) / len(PATHS):.1%} of paths")
+    assert all(after[path] == backends[3].name for path in moved)
+    assert 0.15 < len(moved) / len(PATHS) < 0.35
+
+
+def test_ejection():
+    backends = make_backends(2)
+    balancer = LoadBalancer(backends, policy="round-robin", max_failures=3, ejection_seconds=0.5)
+    bad = backends[0]
+
+    # a success in between resets the count, requests the backend is not to blame for don't count
+    for success in (False, False, True, False, None, False):
+        bad.active_connections += 1
+        balancer.release(bad, success)
+    assert bad.is_available(time.time())
+
+    bad.active_connections += 1
+    balancer.release(bad, False)
+    chosen = set()
+    for _ in range(10):
+        backend = balancer.choose("/")
+        balancer.release(backend, True)
+        chosen.add(backend)
+    print("Chosen while ejected:", chosen)
+    assert chosen == {backends[1]}
+
+    time.sleep(0.6)
+    chosen = set()
+    for _ in range(10):
+        backend = balancer.choose("/")
+        balancer.release(backend, True)
+        chosen.add(backend)
+    print("Chosen after the ejection ended:", chosen)
+    assert chosen == set(backends)
+
+
+def test_exclude_and_least_connections():
+    backends = make_backends(3)
+    balancer = LoadBalancer(backends, policy="least-connections")
+    busy = [balancer.choose("/") for _ in range(3)]
+    assert sorted(b.port for b in busy) == [8080, 8081, 8082]
+
+    # backends already tried for this request are skipped, None when nothing is left
+    assert balancer.choose("/", exclude=backends[:2]) is backends[2]
+    assert balancer.choose("/", exclude=backends) is None
+    print("Exclude and least-connections OK")
+
+
+if __name__ == "__main__":
+    test_ring_balance()
+    test_ring_stability_on_removal()
+    test_ring_stability_on_addition()
+    test_ejection()
+    test_exclude_and_least_connections()
+    print("All load balancer checks passed")
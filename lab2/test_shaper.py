@@ -0,0 +1,101 @@
+import time
+import threading
+
+from Shaper import EgressShaper
+
+KB = 1024
+
+
+class FakeConn:
+    """Records when each piece was sent instead of sending it."""
+
+    def __init__(self):
+        self.sent = 0
+        self.finished_at = None
+
+    def sendall(self, data):
+        self.sent += len(data)
+        self.finished_at = time.monotonic()
+
+
+def send_in_threads(shaper, transfers):
+    """transfers: [(ip, size)], all started together; returns the FakeConn of each."""
+    conns = [FakeConn() for _ in transfers]
+    threads = [
+        threading.Thread(target=shaper.sendall, args=(conn, ip, bytes(size)))
+        for conn, (ip, size) in zip(conns, transfers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return conns
+
+
+def test_global_rate():
+    rate = 200 * KB
+    shaper = EgressShaper(global_rate=rate)
+    start = time.monotonic()
+    conns = send_in_threads(shaper, [("10.0.0.1", 200 * KB), ("10.0.0.2", 200 * KB)])
+    elapsed = time.monotonic() - start
+
+    # the first burst (half a second worth) goes out at once, the rest at the rate
+    expected = (400 * KB - rate * shaper.burst_seconds) / rate
+    print(f"Global rate: 400 KB in {elapsed:.2f}s, expected {expected:.2f}s")
+    assert all(conn.sent == 200 * KB for conn in conns)
+    assert expected * 0.8 <= elapsed <= expected * 1.3
+
+
+def test_per_ip_rate():
+    rate = 100 * KB
+    shaper = EgressShaper(per_ip_rate=rate)
+    start = time.monotonic()
+    conns = send_in_threads(shaper, [("10.0.0.1", 150 * KB), ("10.0.0.2", 150 * KB)])
+    elapsed = time.monotonic() - start
+
+    # each client has its own bucket, so both finish in the time one alone would take
+    expected = (150 * KB - rate * shaper.burst_seconds) / rate
+    print(f"Per-IP rate: 2 x 150 KB in {elapsed:.2f}s, expected {expected:.2f}s")
+    assert all(conn.sent == 150 * KB for conn in conns)
+    assert expected * 0.8 <= elapsed <= expected * 1.3
+
+
+def test_small_page_not_stuck_behind_download():
+    rate = 200 * KB
+    shaper = EgressShaper(global_rate=rate)
+    download, page = FakeConn(), FakeConn()
+
+    start = time.monotonic()
+    big = threading.Thread(target=shaper.sendall, args=(download, "10.0.0.1", bytes(600 * KB)))
+    big.start()
+    time.sleep(0.2)
+    shaper.sendall(page, "10.0.0.2", bytes(32 * KB))
+    big.join()
+
+    page_time = page.finished_at - start
+    download_time = download.finished_at - start
+    print(f"Fairness: 32 KB page done after {page_time:.2f}s, 600 KB download after {download_time:.2f}s")
+    # two pieces of the page alternate with pieces of the download
+    assert page_time < 0.2 + 6 * shaper.quantum / rate
+    assert page_time < download_time / 2
+
+
+def test_many_waiters():
+    # everyone waiting used to be woken for every piece sent
+    shaper = EgressShaper(global_rate=4000 * KB, quantum=KB)
+    start = time.monotonic()
+    conns = send_in_threads(shaper, [(f"10.0.{i // 256}.{i % 256}", 8 * KB) for i in range(1000)])
+    elapsed = time.monotonic() - start
+
+    expected = (1000 * 8 * KB - shaper.global_bucket.burst) / (4000 * KB)
+    print(f"1000 concurrent transfers: {elapsed:.2f}s, expected {expected:.2f}s")
+    assert all(conn.sent == 8 * KB for conn in conns)
+    assert elapsed <= expected * 1.5 + 0.2
+
+
+if __name__ == "__main__":
+    test_global_rate()
+    test_per_ip_rate()
+    test_small_page_not_stuck_behind_download()
+    test_many_waiters()
+    print("All shaper checks passed")